@@ -0,0 +1,21 @@
+"""Lance toutes les analyses dans un seul process.
+
+L'historique CSV n'est parsé qu'une fois : le CSV brut, ses timestamps et la
+table d'occupation (`history.load_occupancy`) sont en cache, puis partagés entre :
+- analyze_correlations (fenêtres 7/14/21/30 jours)
+- analyze_saturation (7 derniers jours)
+"""
+
+from __future__ import annotations
+
+import analyze_correlations
+import analyze_saturation
+
+
+def main() -> None:
+    analyze_correlations.main()
+    analyze_saturation.main()
+
+
+if __name__ == "__main__":
+    main()
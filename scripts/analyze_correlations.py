@@ -22,12 +22,13 @@ Sorties :
 
 from __future__ import annotations
 
-import math
-from collections import defaultdict
 from datetime import timedelta
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+import pandas as pd
+
 from config import (
     DEFAULT_MAX_DISTANCE_KM,
     DISTANCE_WEIGHT_KM,
@@ -37,70 +38,14 @@ from config import (
     MIN_COMMON_POINTS,
     TOP_N_PAIRS,
 )
-from geo import haversine_km
-from stats_lib import correlation
-from utils import load_json, make_timestamp, max_timestamp_in_csv, read_semicolon_csv, save_json
+from geo import haversine_km_matrix
+from history import first_seen_rank, load_occupancy, occupancy_pivot, type_block
+from utils import load_json, max_timestamp_in_csv, save_json
 
 
 LOOKBACK_OPTIONS = [7, 14, 21, 30]
 
 
-def _to_float(x: str) -> Optional[float]:
-    try:
-        return float(x)
-    except Exception:  # noqa: BLE001
-        return None
-
-
-def _load_time_series_occupancy(
-    csv_rows: List[Dict[str, str]],
-    cutoff_ts: Optional[Any],
-) -> Dict[str, Dict[str, Dict[Any, float]]]:
-    """Retourne series[type][name][timestamp] = taux_occupation (0..1)."""
-    series: Dict[str, Dict[str, Dict[Any, float]]] = {"Voiture": defaultdict(dict), "Velo": defaultdict(dict)}
-
-    for r in csv_rows:
-        d = (r.get("Date") or "").strip()
-        t = (r.get("Heure") or "").strip()
-        typ = (r.get("Type") or "").strip()
-        name = (r.get("Nom") or "").strip()
-        free_s = (r.get("Places_Libres") or "").strip()
-        total_s = (r.get("Places_Totales") or "").strip()
-
-        if not d or not t or not typ or not name:
-            continue
-
-        try:
-            ts = make_timestamp(d, t)
-        except ValueError:
-            continue
-
-        if cutoff_ts is not None and ts < cutoff_ts:
-            continue
-
-        free = _to_float(free_s)
-        total = _to_float(total_s)
-        if free is None or total is None or total <= 0:
-            continue
-
-        if typ not in series:
-            continue
-
-        # taux d'occupation (0..1)
-        occ = 1.0 - (free / total)
-
-        # bornage par sécurité
-        if occ < 0:
-            occ = 0.0
-        if occ > 1:
-            occ = 1.0
-
-        # Si doublon timestamp, on garde le dernier
-        series[typ][name][ts] = occ
-
-    return series
-
-
 def _coord(meta: Dict[str, Any], typ: str, name: str) -> Optional[Tuple[float, float]]:
     d = meta.get(typ, {}).get(name)
     if not isinstance(d, dict):
@@ -115,84 +60,115 @@ def _coord(meta: Dict[str, Any], typ: str, name: str) -> Optional[Tuple[float, f
         return None
 
 
-def _output_path(days: int) -> Path:
-    return Path("docs") / "data" / f"correlations_{days}.json"
-
-
-def compute_for_days(
-    csv_rows: List[Dict[str, str]],
-    meta: Dict[str, Any],
-    latest_ts: Optional[Any],
-    days: int,
-) -> Dict[str, Any]:
-    cutoff_ts = None
-    if latest_ts is not None:
-        cutoff_ts = latest_ts - timedelta(days=days)
-
-    series = _load_time_series_occupancy(csv_rows, cutoff_ts)
+def _coord_arrays(meta: Dict[str, Any], typ: str, names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Retourne (lats, lons) dans l'ordre de `names`, NaN si coordonnées inconnues."""
+    xy = np.array([_coord(meta, typ, name) or (np.nan, np.nan) for name in names], dtype=np.float64).reshape(-1, 2)
+    return xy[:, 0], xy[:, 1]
 
-    cars_series = {name: ts_map for name, ts_map in series["Voiture"].items() if len(ts_map) >= 2}
-    bikes_series = {name: ts_map for name, ts_map in series["Velo"].items() if len(ts_map) >= 2}
 
-    cars = sorted(cars_series.keys())
-    bikes = sorted(bikes_series.keys())
+def _distance_frame(meta: Dict[str, Any], cars: List[str], bikes: List[str]) -> pd.DataFrame:
+    """Distances voiture × vélo en km (index = voitures, colonnes = vélos), NaN si inconnue."""
+    car_lat, car_lon = _coord_arrays(meta, "Voiture", cars)
+    bike_lat, bike_lon = _coord_arrays(meta, "Velo", bikes)
+    return pd.DataFrame(haversine_km_matrix(car_lat, car_lon, bike_lat, bike_lon), index=cars, columns=bikes)
 
-    pairs: List[Dict[str, Any]] = []
 
-    for car_name, car_map in cars_series.items():
-        car_xy = _coord(meta, "Voiture", car_name)
+def _pairwise_pearson(cars_block: pd.DataFrame, bikes_block: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Pearson voiture × vélo, chaque paire sur ses propres timestamps communs.
 
-        for bike_name, bike_map in bikes_series.items():
-            # Alignement temporel strict (mêmes timestamps)
-            common_ts = sorted(set(car_map.keys()) & set(bike_map.keys()))
-            n = len(common_ts)
-            if n < MIN_COMMON_POINTS:
-                continue
+    `DataFrame.corr` gère les NaN paire par paire (observations communes) ;
+    on ne garde que le bloc croisé voiture × vélo.
 
-            x = [car_map[ts] for ts in common_ts]   # taux occupation voiture
-            y = [bike_map[ts] for ts in common_ts]  # taux occupation vélo
+    Retourne (r, n), deux matrices (n_cars, n_bikes).
+    r vaut 0.0 si l'écart-type d'une des séries est nul (comme `stats_lib.correlation`).
+    """
+    n_cars = cars_block.shape[1]
+    combined = pd.concat([cars_block, bikes_block], axis=1, keys=["c", "b"])
+    r = combined.corr(min_periods=MIN_COMMON_POINTS).to_numpy()[:n_cars, n_cars:]
 
-            r = correlation(x, y)
+    car_mask = cars_block.notna().to_numpy(dtype=np.int32)
+    bike_mask = bikes_block.notna().to_numpy(dtype=np.int32)
+    n = car_mask.T @ bike_mask
 
-            bike_xy = _coord(meta, "Velo", bike_name)
-            distance_km: Optional[float] = None
-            if car_xy and bike_xy:
-                distance_km = haversine_km(car_xy[0], car_xy[1], bike_xy[0], bike_xy[1])
+    # NaN avec assez de points communs = variance nulle
+    return np.where(np.isnan(r), 0.0, r), n
 
-            score = abs(r)
-            if distance_km is not None:
-                score = abs(r) * math.exp(-distance_km / DISTANCE_WEIGHT_KM)
 
-            pairs.append(
-                {
-                    "car": car_name,
-                    "bike": bike_name,
-                    "r": round(float(r), 4),
-                    "abs_r": round(float(abs(r)), 4),
-                    "distance_km": round(float(distance_km), 3) if distance_km is not None else None,
-                    "n": n,
-                    "score": round(float(score), 4),
-                }
-            )
+def _output_path(days: int) -> Path:
+    return Path("docs") / "data" / f"correlations_{days}.json"
 
-    pair_map = {(p["car"], p["bike"]): p for p in pairs}
 
-    matrix: List[List[Optional[float]]] = []
-    for car_name in cars:
-        row: List[Optional[float]] = []
-        for bike_name in bikes:
-            p = pair_map.get((car_name, bike_name))
-            row.append(p["r"] if p is not None else None)
-        matrix.append(row)
+def _series_block(wide: pd.DataFrame, typ: str) -> pd.DataFrame:
+    """Séries d'un type ayant au moins 2 points, triées par nom."""
+    block = type_block(wide, typ)
+    return block.loc[:, block.count() >= 2]
 
-    pairs_sorted = sorted(pairs, key=lambda p: p["score"], reverse=True)
 
-    top_global = [
-        p
-        for p in pairs_sorted
-        if p["abs_r"] >= MIN_ABS_CORRELATION_TO_SHOW
-        and (p["distance_km"] is None or p["distance_km"] <= DEFAULT_MAX_DISTANCE_KM)
-    ][:TOP_N_PAIRS]
+def compute_for_days(
+    wide: pd.DataFrame,
+    distances: pd.DataFrame,
+    latest_ts: Optional[Any],
+    days: int,
+    first_seen: Dict[Tuple[str, str], int],
+) -> Dict[str, Any]:
+    """Corrélations sur la fenêtre `wide` (déjà restreinte aux `days` derniers jours).
+
+    `distances` doit couvrir toutes les séries présentes dans `wide`.
+    `first_seen` (cf. `history.first_seen_rank`) départage les paires de même
+    score : ordre de première apparition dans la fenêtre, voiture puis vélo.
+    """
+    cars_block = _series_block(wide, "Voiture")
+    bikes_block = _series_block(wide, "Velo")
+
+    cars = list(cars_block.columns)
+    bikes = list(bikes_block.columns)
+
+    # Alignement temporel strict (mêmes timestamps), paire par paire
+    r_matrix, n_matrix = _pairwise_pearson(cars_block, bikes_block)
+
+    distance_matrix = distances.loc[cars, bikes].to_numpy(dtype=np.float64)
+
+    # Score = |r| * exp(-d / DISTANCE_WEIGHT_KM), ou |r| si distance inconnue
+    weight_matrix = np.exp(-distance_matrix / DISTANCE_WEIGHT_KM)
+    score_matrix = np.abs(r_matrix) * np.where(np.isnan(weight_matrix), 1.0, weight_matrix)
+
+    # Arrondis pour le JSON, faits une fois sur les matrices
+    r_round = np.round(r_matrix, 4)
+    abs_r_round = np.round(np.abs(r_matrix), 4)
+    distance_round = np.round(distance_matrix, 3)
+    score_round = np.round(score_matrix, 4)
+
+    kept = n_matrix >= MIN_COMMON_POINTS
+
+    # Paires retenues, triées par score décroissant puis par première apparition
+    kept_idx = np.argwhere(kept)
+    car_rank = np.array([first_seen[("Voiture", name)] for name in cars], dtype=np.int64)
+    bike_rank = np.array([first_seen[("Velo", name)] for name in bikes], dtype=np.int64)
+    order = np.lexsort((bike_rank[kept_idx[:, 1]], car_rank[kept_idx[:, 0]], -score_round[kept]))
+    kept_idx = kept_idx[order]
+
+    pairs_sorted: List[Dict[str, Any]] = []
+    for i, j in kept_idx:
+        distance_km = distance_round[i, j]
+        pairs_sorted.append(
+            {
+                "car": cars[i],
+                "bike": bikes[j],
+                "r": float(r_round[i, j]),
+                "abs_r": float(abs_r_round[i, j]),
+                "distance_km": None if np.isnan(distance_km) else float(distance_km),
+                "n": int(n_matrix[i, j]),
+                "score": float(score_round[i, j]),
+            }
+        )
+
+    matrix: List[List[Optional[float]]] = np.where(kept, r_round, None).tolist()
+
+    shown = (abs_r_round >= MIN_ABS_CORRELATION_TO_SHOW) & (
+        np.isnan(distance_round) | (distance_round <= DEFAULT_MAX_DISTANCE_KM)
+    )
+    shown_sorted = shown[kept_idx[:, 0], kept_idx[:, 1]]
+    top_global = [pairs_sorted[k] for k in np.flatnonzero(shown_sorted)[:TOP_N_PAIRS]]
 
     out = {
         "generated_at": (latest_ts.isoformat() if latest_ts is not None else None),
@@ -210,19 +186,37 @@ def compute_for_days(
         "matrix": matrix,
         "pairs": pairs_sorted,
         "top_global": top_global,
-        "counts": {"cars": len(cars), "bikes": len(bikes), "pairs_computed": len(pairs)},
+        "counts": {"cars": len(cars), "bikes": len(bikes), "pairs_computed": len(pairs_sorted)},
     }
 
     return out
 
 
 def main() -> None:
-    csv_rows = read_semicolon_csv(HISTORY_CSV)
+    occ = load_occupancy(HISTORY_CSV)
     meta = load_json(METADATA_JSON, default={"Voiture": {}, "Velo": {}})
     latest_ts = max_timestamp_in_csv(HISTORY_CSV)
 
+    # Un seul pivot sur la plus grande fenêtre ; les autres en sont des tranches
+    cutoff_ts = None
+    if latest_ts is not None:
+        cutoff_ts = latest_ts - timedelta(days=max(LOOKBACK_OPTIONS))
+    wide_all = occupancy_pivot(occ, cutoff_ts)
+
+    # Les distances ne dépendent pas de la fenêtre
+    distances = _distance_frame(
+        meta,
+        list(type_block(wide_all, "Voiture").columns),
+        list(type_block(wide_all, "Velo").columns),
+    )
+
     for days in LOOKBACK_OPTIONS:
-        out = compute_for_days(csv_rows, meta, latest_ts, days)
+        wide = wide_all
+        window_start = None
+        if latest_ts is not None:
+            window_start = latest_ts - timedelta(days=days)
+            wide = wide_all.loc[window_start:]
+        out = compute_for_days(wide, distances, latest_ts, days, first_seen_rank(occ, window_start))
         save_json(_output_path(days), out)
         print(f"OK - correlations_{days}.json écrit (paires: {out['counts']['pairs_computed']})")
 
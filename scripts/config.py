@@ -26,6 +26,8 @@ DOCS_DATA_DIR = DOCS_DIR / "data"
 
 HISTORY_CSV = DATA_DIR / "historique_parkings.csv"
 METADATA_JSON = DATA_DIR / "metadata.json"
+# Index incrémental de l'historique (évite de relire tout le CSV à chaque run)
+HISTORY_INDEX_JSON = DATA_DIR / "historique_index.json"
 
 LATEST_SNAPSHOT_JSON = DOCS_DATA_DIR / "latest_snapshot.json"
 CORRELATIONS_JSON = DOCS_DATA_DIR / "correlations.json"
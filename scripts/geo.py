@@ -4,6 +4,8 @@ from __future__ import annotations
 
 import math
 
+import numpy as np
+
 
 def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Distance en km entre deux points (lat/lon en degrés)."""
@@ -17,3 +19,20 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return r * c
+
+
+def haversine_km_matrix(lats1: np.ndarray, lons1: np.ndarray, lats2: np.ndarray, lons2: np.ndarray) -> np.ndarray:
+    """Matrice (n1, n2) des distances en km entre deux ensembles de points (degrés).
+
+    Une coordonnée NaN donne une distance NaN.
+    """
+    r = 6371.0  # Rayon moyen terrestre (km)
+
+    phi1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lambda1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lambda2 = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return r * c
@@ -0,0 +1,94 @@
+"""Chargement de l'historique CSV sous forme de tableaux pandas.
+
+Utilisé par les scripts d'analyse (corrélations, saturation) : le CSV brut
+vient de `utils.load_history_frame` ; la table d'occupation qui en dérive est
+mise en cache avec la même clé, puis pivotée en une matrice
+timestamp × (Type, Nom) de taux d'occupation.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import history_cache_key, history_timestamps, load_history_frame
+
+
+SERIES_TYPES = ("Voiture", "Velo")
+
+
+def load_occupancy(history_csv: Path) -> pd.DataFrame:
+    """Retourne un relevé valide par ligne : colonnes ts, Type, Nom, occ.
+
+    Taux d'occupation : occ = 1 - (libres/total), borné à [0, 1].
+    Les lignes sans date/heure/type/nom valides ou avec total <= 0 sont ignorées.
+
+    Calculé une seule fois par process tant que le CSV ne change pas (même clé
+    que `utils.load_history_frame`) : le DataFrame retourné est partagé, ne pas
+    le modifier.
+    """
+    return _cached_occupancy(*history_cache_key(history_csv))
+
+
+@lru_cache(maxsize=1)
+def _cached_occupancy(history_csv: Path, mtime_ns: Optional[int]) -> pd.DataFrame:
+    df = load_history_frame(history_csv)
+
+    typ = df["Type"].str.strip()
+    name = df["Nom"].str.strip()
+    date_s = df["Date"].str.strip()
+    time_s = df["Heure"].str.strip()
+    # Timestamps déjà parsés pour `max_timestamp_in_csv` ; on ne reparse que
+    # les rares lignes dont la date/heure est entourée d'espaces
+    ts = history_timestamps(history_csv)
+    padded = ((date_s != df["Date"]) | (time_s != df["Heure"])).to_numpy()
+    if padded.any():
+        ts = ts.copy()
+        ts[padded] = pd.to_datetime(
+            date_s[padded] + " " + time_s[padded],
+            format="%Y-%m-%d %H:%M",
+            errors="coerce",
+        )
+    free = pd.to_numeric(df["Places_Libres"], errors="coerce").to_numpy(dtype=np.float64)
+    total = pd.to_numeric(df["Places_Totales"], errors="coerce").to_numpy(dtype=np.float64)
+
+    keep = (ts.notna() & typ.isin(SERIES_TYPES) & (name != "")).to_numpy() & ~np.isnan(free) & (total > 0)
+
+    out = pd.DataFrame({"ts": ts, "Type": typ, "Nom": name})[keep]
+    # Bornage [0, 1] sans branche, sur les tableaux bruts
+    out["occ"] = np.clip(1.0 - free[keep] / total[keep], 0.0, 1.0)
+    return out.reset_index(drop=True)
+
+
+def occupancy_pivot(occ: pd.DataFrame, cutoff_ts: Optional[datetime]) -> pd.DataFrame:
+    """Matrice large : index = timestamp (trié), colonnes = (Type, Nom), valeurs = occ.
+
+    Si doublon de timestamp pour une même série, on garde le dernier relevé.
+    """
+    if cutoff_ts is not None:
+        occ = occ[occ["ts"] >= cutoff_ts]
+    wide = occ.pivot_table(index="ts", columns=["Type", "Nom"], values="occ", aggfunc="last")
+    if not isinstance(wide.columns, pd.MultiIndex):
+        wide.columns = pd.MultiIndex.from_tuples([], names=["Type", "Nom"])
+    return wide.sort_index()
+
+
+def first_seen_rank(occ: pd.DataFrame, cutoff_ts: Optional[datetime]) -> Dict[Tuple[str, str], int]:
+    """Rang de première apparition (ordre du CSV) de chaque série (Type, Nom) depuis `cutoff_ts`."""
+    if cutoff_ts is not None:
+        occ = occ[occ["ts"] >= cutoff_ts]
+    keys = occ[["Type", "Nom"]].drop_duplicates()
+    return {key: rank for rank, key in enumerate(zip(keys["Type"], keys["Nom"]))}
+
+
+def type_block(wide: pd.DataFrame, typ: str) -> pd.DataFrame:
+    """Colonnes d'un type ("Voiture" | "Velo"), indexées par nom, triées par nom."""
+    if typ not in wide.columns.get_level_values(0):
+        return pd.DataFrame(index=wide.index)
+    block = wide[typ]
+    return block[sorted(block.columns)]
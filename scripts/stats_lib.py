@@ -13,13 +13,16 @@ Les calculs sont faits "à la main" (sans numpy/pandas) :
 - covariance population : (1/n) * Σ (xi - mx) (yi - my)
 - corrélation : cov / (σx * σy)
 
+Les sommes centrées sont accumulées en une seule passe (récurrence de
+Welford), plus stable numériquement que Σx² - n·m².
+
 Si une liste est vide, une ValueError est levée.
 """
 
 from __future__ import annotations
 
 import math
-from typing import Iterable, List, Sequence
+from typing import Iterable, List, Sequence, Tuple
 
 
 def _as_list(values: Iterable[float]) -> List[float]:
@@ -35,23 +38,55 @@ def moyenne(values: Iterable[float]) -> float:
 
 
 def variance(values: Iterable[float]) -> float:
-    vals = _as_list(values)
-    m = moyenne(vals)
-    return sum((x - m) ** 2 for x in vals) / len(vals)
+    n = 0
+    mean = 0.0
+    m2 = 0.0
+    for x in values:
+        n += 1
+        d = x - mean
+        mean += d / n
+        m2 += d * (x - mean)
+    if n == 0:
+        raise ValueError("Liste vide")
+    return m2 / n
 
 
 def ecart_type(values: Iterable[float]) -> float:
     return math.sqrt(variance(values))
 
 
-def covariance(x: Iterable[float], y: Iterable[float]) -> float:
+def _welford_pair(xs: Sequence[float], ys: Sequence[float]) -> Tuple[float, float, float]:
+    """Une passe sur (xs, ys) : retourne (Σ(xi-mx)², Σ(yi-my)², Σ(xi-mx)(yi-my))."""
+    n = 0
+    mx = 0.0
+    my = 0.0
+    m2x = 0.0
+    m2y = 0.0
+    cxy = 0.0
+    for x, y in zip(xs, ys):
+        n += 1
+        dx = x - mx
+        dy = y - my
+        mx += dx / n
+        my += dy / n
+        m2x += dx * (x - mx)
+        m2y += dy * (y - my)
+        cxy += dx * (y - my)
+    return m2x, m2y, cxy
+
+
+def _as_pair(x: Iterable[float], y: Iterable[float]) -> Tuple[List[float], List[float]]:
     xs = _as_list(x)
     ys = _as_list(y)
     if len(xs) != len(ys):
         raise ValueError("Listes de tailles différentes")
-    mx = moyenne(xs)
-    my = moyenne(ys)
-    return sum((a - mx) * (b - my) for a, b in zip(xs, ys)) / len(xs)
+    return xs, ys
+
+
+def covariance(x: Iterable[float], y: Iterable[float]) -> float:
+    xs, ys = _as_pair(x, y)
+    _m2x, _m2y, cxy = _welford_pair(xs, ys)
+    return cxy / len(xs)
 
 
 def correlation(x: Iterable[float], y: Iterable[float]) -> float:
@@ -59,25 +94,45 @@ def correlation(x: Iterable[float], y: Iterable[float]) -> float:
 
     Retourne 0.0 si l'écart-type d'une des séries est nul.
     """
-    xs = _as_list(x)
-    ys = _as_list(y)
-    if len(xs) != len(ys):
-        raise ValueError("Listes de tailles différentes")
-
-    sx = ecart_type(xs)
-    sy = ecart_type(ys)
-    if sx == 0.0 or sy == 0.0:
+    xs, ys = _as_pair(x, y)
+    m2x, m2y, cxy = _welford_pair(xs, ys)
+    if m2x == 0.0 or m2y == 0.0:
         return 0.0
-    return covariance(xs, ys) / (sx * sy)
+    return cxy / math.sqrt(m2x * m2y)
+
+
+def _standardise(values: Sequence[float]) -> List[float]:
+    """Centre-réduit une série (z-scores, σ population). Série nulle si σ = 0."""
+    xs = _as_list(values)
+    m = moyenne(xs)
+    s = ecart_type(xs)
+    if s == 0.0:
+        return [0.0] * len(xs)
+    return [(v - m) / s for v in xs]
 
 
 def matrice_correlation(series: Sequence[Sequence[float]]) -> List[List[float]]:
-    """Matrice NxN des corrélations entre N séries."""
+    """Matrice NxN des corrélations entre N séries.
+
+    Chaque série est centrée-réduite une seule fois ; corr(i, j) est alors
+    la moyenne des produits zi·zj (0.0 si une des séries est constante).
+    Seul le triangle supérieur est calculé, puis recopié.
+    """
     if len(series) == 0:
         raise ValueError("Aucune série")
+    z = [_standardise(s) for s in series]
+    length = len(z[0])
+    if any(len(zi) != length for zi in z):
+        raise ValueError("Listes de tailles différentes")
+
     n = len(series)
     mat: List[List[float]] = [[0.0] * n for _ in range(n)]
     for i in range(n):
-        for j in range(n):
-            mat[i][j] = correlation(series[i], series[j])
+        # corr(x, x) = 1, sauf série constante (0.0 par convention)
+        mat[i][i] = 1.0 if any(z[i]) else 0.0
+        # Matrice symétrique : on ne calcule que le triangle supérieur
+        for j in range(i + 1, n):
+            c = sum(a * b for a, b in zip(z[i], z[j])) / length
+            mat[i][j] = c
+            mat[j][i] = c
     return mat
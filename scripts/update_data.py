@@ -10,7 +10,9 @@ Il fait 3 choses :
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import chain
 from typing import Any, Dict, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 
@@ -21,6 +23,7 @@ from config import (
     CAR_PARKINGS_URLS,
     DOCS_DATA_DIR,
     HISTORY_CSV,
+    HISTORY_INDEX_JSON,
     HTTP_TIMEOUT_SECONDS,
     LATEST_SNAPSHOT_JSON,
     METADATA_DOCS_JSON,
@@ -30,20 +33,22 @@ from config import (
 from utils import (
     CsvRow,
     append_semicolon_csv,
-    existing_keys_for_timestamp,
-    load_canonical_name_maps,
+    build_history_index,
+    existing_keys_from_index,
+    load_history_index,
     load_json,
     normalize_key,
     prop_value,
     safe_int,
     save_json,
+    update_history_index,
 )
 
 
 CSV_HEADER = ["Date", "Heure", "Type", "Nom", "Places_Libres", "Places_Totales"]
 
 
-def _get_tz() -> ZoneInfo:
+def _load_tz() -> ZoneInfo:
     """Retourne le fuseau configuré, ou UTC si indisponible."""
     try:
         return ZoneInfo(TIMEZONE)
@@ -51,21 +56,24 @@ def _get_tz() -> ZoneInfo:
         return ZoneInfo("UTC")
 
 
+# Fuseau résolu une seule fois, à l'import
+_TZ = _load_tz()
+
+
 def _fetch_json_first_working(urls: List[str]) -> Tuple[str, Any]:
     """Essaie plusieurs endpoints (fallback). Retourne (url_utilisee, payload_json)."""
     last_error: Optional[Exception] = None
-    for url in urls:
-        try:
-            resp = requests.get(
-                url,
-                timeout=HTTP_TIMEOUT_SECONDS,
-                headers={"User-Agent": "parking-correlation-site/1.0"},
-            )
-            resp.raise_for_status()
-            return url, resp.json()
-        except Exception as e:  # noqa: BLE001
-            last_error = e
-            continue
+    # Une session par famille d'endpoints : connexions réutilisées entre les essais
+    with requests.Session() as session:
+        session.headers["User-Agent"] = "parking-correlation-site/1.0"
+        for url in urls:
+            try:
+                resp = session.get(url, timeout=HTTP_TIMEOUT_SECONDS)
+                resp.raise_for_status()
+                return url, resp.json()
+            except Exception as e:  # noqa: BLE001
+                last_error = e
+                continue
 
     raise RuntimeError(f"Aucun endpoint ne répond. Dernière erreur: {last_error}")
 
@@ -85,6 +93,15 @@ def _extract_point(entity: Dict[str, Any]) -> Optional[Tuple[float, float]]:
     return None
 
 
+def _first_prop_value(entity: Dict[str, Any], *keys: str) -> Any:
+    """`prop_value` du premier attribut non nul parmi `keys` (ordre de fallback), sinon None."""
+    for key in keys:
+        v = entity.get(key)
+        if v is not None:
+            return prop_value(v)
+    return None
+
+
 def _canonicalize_name(typ: str, raw_name: str, canonical_maps: Dict[str, Dict[str, str]]) -> str:
     key = normalize_key(raw_name)
     if typ in canonical_maps and key in canonical_maps[typ]:
@@ -92,18 +109,29 @@ def _canonicalize_name(typ: str, raw_name: str, canonical_maps: Dict[str, Dict[s
     return raw_name
 
 
-def _parse_bike_entities(payload: Any, canonical_maps: Dict[str, Dict[str, str]]) -> Tuple[List[CsvRow], List[Dict[str, Any]]]:
+def _sorted_by_keys(
+    rows: List[CsvRow],
+    items: List[Dict[str, Any]],
+    sort_keys: List[str],
+) -> Tuple[List[CsvRow], List[Dict[str, Any]]]:
+    """Trie rows/items (alignés) ensemble, selon une clé déjà calculée par entité."""
+    order = sorted(range(len(sort_keys)), key=sort_keys.__getitem__)
+    return [rows[i] for i in order], [items[i] for i in order]
+
+
+def _parse_bike_entities(
+    payload: Any,
+    canonical_maps: Dict[str, Dict[str, str]],
+    date_str: str,
+    time_str: str,
+) -> Tuple[List[CsvRow], List[Dict[str, Any]]]:
     """Parse la réponse de /bikestation.
 
     On stocke les "places libres" = freeSlotNumber (places de stationnement disponibles).
     """
     rows: List[CsvRow] = []
     items: List[Dict[str, Any]] = []
-
-    tz = _get_tz()
-    now = datetime.now(tz)
-    date_str = now.strftime("%Y-%m-%d")
-    time_str = now.strftime("%H:%M")
+    sort_keys: List[str] = []
 
     if not isinstance(payload, list):
         return rows, items
@@ -128,6 +156,7 @@ def _parse_bike_entities(payload: Any, canonical_maps: Dict[str, Dict[str, str]]
         total = safe_int(prop_value(e.get("totalSlotNumber")))
 
         rows.append(CsvRow(date=date_str, time=time_str, type="Velo", name=name, free=free, total=total))
+        sort_keys.append(normalize_key(name))
 
         pt = _extract_point(e)
         lat, lon = (pt if pt else (None, None))
@@ -144,12 +173,15 @@ def _parse_bike_entities(payload: Any, canonical_maps: Dict[str, Dict[str, str]]
             }
         )
 
-    rows.sort(key=lambda r: normalize_key(r.name))
-    items.sort(key=lambda it: normalize_key(it["name"]))
-    return rows, items
+    return _sorted_by_keys(rows, items, sort_keys)
 
 
-def _parse_car_entities(payload: Any, canonical_maps: Dict[str, Dict[str, str]]) -> Tuple[List[CsvRow], List[Dict[str, Any]]]:
+def _parse_car_entities(
+    payload: Any,
+    canonical_maps: Dict[str, Dict[str, str]],
+    date_str: str,
+    time_str: str,
+) -> Tuple[List[CsvRow], List[Dict[str, Any]]]:
     """Parse la réponse d'un endpoint de parkings voitures.
 
     On vise le modèle FIWARE OffStreetParking :
@@ -158,11 +190,7 @@ def _parse_car_entities(payload: Any, canonical_maps: Dict[str, Dict[str, str]])
     """
     rows: List[CsvRow] = []
     items: List[Dict[str, Any]] = []
-
-    tz = _get_tz()
-    now = datetime.now(tz)
-    date_str = now.strftime("%Y-%m-%d")
-    time_str = now.strftime("%H:%M")
+    sort_keys: List[str] = []
 
     if not isinstance(payload, list):
         return rows, items
@@ -183,22 +211,14 @@ def _parse_car_entities(payload: Any, canonical_maps: Dict[str, Dict[str, str]])
 
         name = _canonicalize_name("Voiture", raw_name, canonical_maps)
 
-        free = safe_int(
-            prop_value(e.get("availableSpotNumber"))
-            if e.get("availableSpotNumber") is not None
-            else prop_value(e.get("availableSlotNumber"))
-        )
-
-        total = safe_int(
-            prop_value(e.get("totalSpotNumber"))
-            if e.get("totalSpotNumber") is not None
-            else prop_value(e.get("totalSlotNumber"))
-        )
+        free = safe_int(_first_prop_value(e, "availableSpotNumber", "availableSlotNumber"))
+        total = safe_int(_first_prop_value(e, "totalSpotNumber", "totalSlotNumber"))
 
         if total <= 0:
             continue
 
         rows.append(CsvRow(date=date_str, time=time_str, type="Voiture", name=name, free=free, total=total))
+        sort_keys.append(normalize_key(name))
 
         pt = _extract_point(e)
         lat, lon = (pt if pt else (None, None))
@@ -214,14 +234,11 @@ def _parse_car_entities(payload: Any, canonical_maps: Dict[str, Dict[str, str]])
             }
         )
 
-    rows.sort(key=lambda r: normalize_key(r.name))
-    items.sort(key=lambda it: normalize_key(it["name"]))
-    return rows, items
+    return _sorted_by_keys(rows, items, sort_keys)
 
 
 def _update_metadata(meta: Dict[str, Any], typ: str, items: List[Dict[str, Any]]) -> None:
-    if typ not in meta:
-        meta[typ] = {}
+    bucket = meta.setdefault(typ, {})
     for it in items:
         name = it.get("name")
         lat = it.get("lat")
@@ -229,35 +246,45 @@ def _update_metadata(meta: Dict[str, Any], typ: str, items: List[Dict[str, Any]]
         if not name:
             continue
         if lat is None or lon is None:
-            meta[typ].setdefault(name, {})
+            bucket.setdefault(name, {})
             continue
-        meta[typ][name] = {"lat": float(lat), "lon": float(lon), "id": it.get("id")}
+        bucket[name] = {"lat": float(lat), "lon": float(lon), "id": it.get("id")}
 
 
 def main() -> None:
     DOCS_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-    canonical_maps = load_canonical_name_maps(HISTORY_CSV)
+    # Index incrémental ; reconstruit depuis le CSV s'il manque ou n'est plus à jour
+    history_index = load_history_index(HISTORY_INDEX_JSON, HISTORY_CSV) or build_history_index(HISTORY_CSV)
+    canonical_maps = history_index["canonical_names"]
 
-    car_url, car_payload = _fetch_json_first_working(CAR_PARKINGS_URLS)
-    bike_url, bike_payload = _fetch_json_first_working(BIKE_STATIONS_URLS)
+    # Les deux APIs sont indépendantes : on les interroge en parallèle
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        car_future = pool.submit(_fetch_json_first_working, CAR_PARKINGS_URLS)
+        bike_future = pool.submit(_fetch_json_first_working, BIKE_STATIONS_URLS)
+        car_url, car_payload = car_future.result()
+        bike_url, bike_payload = bike_future.result()
 
-    car_rows, car_items = _parse_car_entities(car_payload, canonical_maps)
-    bike_rows, bike_items = _parse_bike_entities(bike_payload, canonical_maps)
-
-    tz = _get_tz()
-    now = datetime.now(tz)
+    # Un seul "maintenant" pour tout le run (lignes CSV, dédoublonnage, JSON)
+    now = datetime.now(_TZ)
     date_str = now.strftime("%Y-%m-%d")
     time_str = now.strftime("%H:%M")
 
-    already = existing_keys_for_timestamp(HISTORY_CSV, date_str, time_str)
-    to_append: List[CsvRow] = []
-    for r in car_rows + bike_rows:
-        if (r.type, r.name) not in already:
-            to_append.append(r)
+    car_rows, car_items = _parse_car_entities(car_payload, canonical_maps, date_str, time_str)
+    bike_rows, bike_items = _parse_bike_entities(bike_payload, canonical_maps, date_str, time_str)
+
+    already = existing_keys_from_index(history_index, HISTORY_CSV, date_str, time_str)
+    # Une ligne par (Type, Nom) : la dernière lue l'emporte (comme le pivot),
+    # à la position de la première rencontrée, voitures puis vélos
+    candidates: Dict[Tuple[str, str], CsvRow] = {}
+    for r in chain(car_rows, bike_rows):
+        candidates[(r.type, r.name)] = r
+    to_append: List[CsvRow] = [r for key, r in candidates.items() if key not in already]
 
     if to_append:
         append_semicolon_csv(HISTORY_CSV, to_append, header=CSV_HEADER)
+        update_history_index(history_index, to_append, HISTORY_CSV)
+    save_json(HISTORY_INDEX_JSON, history_index)
 
     meta = load_json(METADATA_JSON, default={"Voiture": {}, "Velo": {}, "generated_at": None})
     meta["generated_at"] = now.isoformat()
@@ -4,14 +4,23 @@ from __future__ import annotations
 
 import csv
 import json
+import re
 import unicodedata
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+import pandas as pd
 
-@dataclass(frozen=True)
+try:
+    import orjson
+except ImportError:  # repli sur la lib standard
+    orjson = None  # type: ignore[assignment]
+
+
+@dataclass(frozen=True, slots=True)
 class CsvRow:
     date: str  # YYYY-MM-DD
     time: str  # HH:MM
@@ -21,32 +30,36 @@ class CsvRow:
     total: int
 
 
+# Suite de caractères non alphanumériques (`\W` sans "_" = `not str.isalnum()`)
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+
 def ensure_parent_dir(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
 
 def strip_accents(text: str) -> str:
     """Supprime les accents (utile pour matcher 'Comédie' et 'Comedie')."""
+    if text.isascii():
+        # Déjà sans accent (et invariant par NFKD)
+        return text
     norm = unicodedata.normalize("NFKD", text)
-    return "".join(ch for ch in norm if not unicodedata.combining(ch))
+    # Les diacritiques combinants commencent à U+0300 : test C évité pour le reste
+    return "".join(ch for ch in norm if ord(ch) < 0x300 or not unicodedata.combining(ch))
 
 
+@lru_cache(maxsize=4096)
 def normalize_key(text: str) -> str:
     """Normalise une chaîne pour servir de clé de comparaison.
 
     - minuscules
     - sans accents
     - suppression de certains caractères
+
+    Mis en cache : les mêmes noms de parkings/stations reviennent à chaque run.
     """
-    t = strip_accents(text).lower().strip()
-    # On garde lettres / chiffres, on remplace le reste par des espaces
-    cleaned = []
-    for ch in t:
-        if ch.isalnum():
-            cleaned.append(ch)
-        else:
-            cleaned.append(" ")
-    return " ".join("".join(cleaned).split())
+    # On garde lettres / chiffres (Unicode), le reste devient un seul espace
+    return _NON_ALNUM.sub(" ", strip_accents(text).lower()).strip()
 
 
 def prop_value(x: Any) -> Any:
@@ -58,47 +71,102 @@ def prop_value(x: Any) -> Any:
 
 def safe_int(x: Any, default: int = 0) -> int:
     """Convertit en int si possible."""
+    if x is None:
+        return default
+    # Cas courant (JSON) : déjà un entier, pas de détour par float
+    if type(x) is int:
+        return x
     try:
-        if x is None:
-            return default
-        return int(float(x))
+        if isinstance(x, (str, bytes)):
+            return int(float(x))  # accepte "12.0"
+        return int(x)
     except (ValueError, TypeError):
         return default
 
 
-def read_semicolon_csv(path: Path) -> List[Dict[str, str]]:
-    if not path.exists():
-        return []
-    with path.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f, delimiter=";")
-        return list(reader)
-
-
 def append_semicolon_csv(path: Path, rows: List[CsvRow], header: List[str]) -> None:
     ensure_parent_dir(path)
     file_exists = path.exists()
 
-    with path.open("a", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f, delimiter=";")
+    with path.open("a", encoding="utf-8", newline="", buffering=1 << 16) as f:
+        # Fins de ligne LF, comme le CSV stocké par git (`* text=auto`) : sinon la
+        # taille après checkout diffère de celle enregistrée dans l'index
+        writer = csv.writer(f, delimiter=";", lineterminator="\n")
         if not file_exists:
             writer.writerow(header)
-        for r in rows:
-            writer.writerow([r.date, r.time, r.type, r.name, r.free, r.total])
+        writer.writerows((r.date, r.time, r.type, r.name, r.free, r.total) for r in rows)
 
 
 def load_json(path: Path, default: Any) -> Any:
     if not path.exists():
         return default
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
     with path.open("r", encoding="utf-8") as f:
         return json.load(f)
 
 
 def save_json(path: Path, payload: Any) -> None:
     ensure_parent_dir(path)
+    if orjson is not None:
+        # Même rendu que json.dump(..., ensure_ascii=False, indent=2)
+        path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        return
     with path.open("w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
 
 
+HISTORY_COLUMNS = ["Date", "Heure", "Type", "Nom", "Places_Libres", "Places_Totales"]
+
+
+def history_cache_key(history_csv: Path) -> Tuple[Path, Optional[int]]:
+    """Clé des caches de l'historique : (chemin, mtime_ns), mtime None si le CSV manque."""
+    return history_csv, (history_csv.stat().st_mtime_ns if history_csv.exists() else None)
+
+
+def load_history_frame(history_csv: Path) -> pd.DataFrame:
+    """Colonnes de `HISTORY_COLUMNS` du CSV, en chaînes brutes ("" si absent).
+
+    Parsé une seule fois par process (moteur C de pandas) tant que le CSV ne
+    change pas ; toutes les lectures de l'historique passent par ici.
+    Le DataFrame retourné est partagé : ne pas le modifier.
+    """
+    return _cached_history_frame(*history_cache_key(history_csv))
+
+
+@lru_cache(maxsize=1)
+def _cached_history_frame(history_csv: Path, mtime_ns: Optional[int]) -> pd.DataFrame:
+    empty = pd.DataFrame({c: pd.Series(dtype=str) for c in HISTORY_COLUMNS})
+    if mtime_ns is None:
+        return empty
+    try:
+        df = pd.read_csv(
+            history_csv,
+            sep=";",
+            usecols=lambda c: c in HISTORY_COLUMNS,
+            dtype=str,
+            keep_default_na=False,
+            engine="c",
+        )
+    except pd.errors.EmptyDataError:  # fichier de 0 octet
+        return empty
+    for c in HISTORY_COLUMNS:
+        if c not in df.columns:
+            df[c] = ""
+    return df[HISTORY_COLUMNS].fillna("")
+
+
+def history_timestamps(history_csv: Path) -> pd.Series:
+    """Date + Heure de chaque ligne du CSV parsées (NaT si invalides), en cache comme le CSV."""
+    return _cached_history_timestamps(*history_cache_key(history_csv))
+
+
+@lru_cache(maxsize=1)
+def _cached_history_timestamps(history_csv: Path, mtime_ns: Optional[int]) -> pd.Series:
+    df = _cached_history_frame(history_csv, mtime_ns)
+    return pd.to_datetime(df["Date"] + " " + df["Heure"], format="%Y-%m-%d %H:%M", errors="coerce", cache=True)
+
+
 def load_canonical_name_maps(history_csv: Path) -> Dict[str, Dict[str, str]]:
     """Construit un mapping pour stabiliser les noms entre runs.
 
@@ -108,44 +176,30 @@ def load_canonical_name_maps(history_csv: Path) -> Dict[str, Dict[str, str]]:
           "Velo": {"comedie": "Comédie", ...}
         }
     """
-    rows = read_semicolon_csv(history_csv)
-    mapping: Dict[str, Dict[str, str]] = {"Voiture": {}, "Velo": {}}
-
-    for r in rows:
-        typ = r.get("Type", "").strip()
-        name = r.get("Nom", "").strip()
-        if not typ or not name:
-            continue
-        if typ not in mapping:
-            mapping[typ] = {}
-        key = normalize_key(name)
-        # on garde le premier nom rencontré comme canonique
-        mapping[typ].setdefault(key, name)
+    df = load_history_frame(history_csv)
+    typ = df["Type"].str.strip()
+    name = df["Nom"].str.strip()
+    valid = (typ != "") & (name != "")
+
+    names = pd.DataFrame({"Type": typ[valid], "Nom": name[valid]})
+    # normalize_key n'est appelé qu'une fois par nom distinct
+    keys = {n: normalize_key(n) for n in names["Nom"].unique()}
+    names["key"] = names["Nom"].map(keys)
+    # on garde le premier nom rencontré comme canonique
+    first = names.drop_duplicates(["Type", "key"], keep="first")
 
+    mapping: Dict[str, Dict[str, str]] = {"Voiture": {}, "Velo": {}}
+    for t, key, n in zip(first["Type"], first["key"], first["Nom"]):
+        mapping.setdefault(t, {})[key] = n
     return mapping
 
 
-def make_timestamp(date_str: str, time_str: str) -> datetime:
-    """Parse le couple Date/Heure du CSV."""
-    return datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-
-
 def max_timestamp_in_csv(history_csv: Path) -> Optional[datetime]:
     """Retourne le timestamp le plus récent trouvé dans le CSV."""
-    rows = read_semicolon_csv(history_csv)
-    best: Optional[datetime] = None
-    for r in rows:
-        d = r.get("Date")
-        t = r.get("Heure")
-        if not d or not t:
-            continue
-        try:
-            ts = make_timestamp(d, t)
-        except ValueError:
-            continue
-        if best is None or ts > best:
-            best = ts
-    return best
+    best = history_timestamps(history_csv).max()
+    if pd.isna(best):
+        return None
+    return best.to_pydatetime()
 
 
 def existing_keys_for_timestamp(history_csv: Path, date_str: str, time_str: str) -> set[Tuple[str, str]]:
@@ -154,12 +208,99 @@ def existing_keys_for_timestamp(history_csv: Path, date_str: str, time_str: str)
     if not history_csv.exists():
         return keys
 
-    with history_csv.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f, delimiter=";")
-        for r in reader:
-            if r.get("Date") == date_str and r.get("Heure") == time_str:
-                typ = (r.get("Type") or "").strip()
-                name = (r.get("Nom") or "").strip()
-                if typ and name:
-                    keys.add((typ, name))
+    prefix = f"{date_str};{time_str};"
+    with history_csv.open("r", encoding="utf-8", newline="") as f:
+        # Filtre sur la ligne brute : seules les lignes du bon timestamp sont découpées
+        matching = [line for line in f if line.startswith(prefix)]
+
+    for r in csv.reader(matching, delimiter=";"):
+        if len(r) < 4:
+            continue
+        typ = r[2].strip()
+        name = r[3].strip()
+        if typ and name:
+            keys.add((typ, name))
     return keys
+
+
+def build_history_index(history_csv: Path) -> Dict[str, Any]:
+    """Reconstruit l'index de l'historique en relisant tout le CSV.
+
+    Retour:
+        {
+          "csv_size": 123456,                       # taille du CSV indexé (octets)
+          "last_timestamp": "2026-01-01 12:05",     # ou None si CSV vide
+          "keys_at_last_ts": [["Voiture", "Comedie"], ...],
+          "canonical_names": {"Voiture": {...}, "Velo": {...}},
+        }
+    """
+    last = max_timestamp_in_csv(history_csv)
+    keys: set[Tuple[str, str]] = set()
+    if last is not None:
+        keys = existing_keys_for_timestamp(history_csv, last.strftime("%Y-%m-%d"), last.strftime("%H:%M"))
+
+    return {
+        "csv_size": history_csv.stat().st_size if history_csv.exists() else 0,
+        "last_timestamp": last.strftime("%Y-%m-%d %H:%M") if last is not None else None,
+        "keys_at_last_ts": sorted([typ, name] for typ, name in keys),
+        "canonical_names": load_canonical_name_maps(history_csv),
+    }
+
+
+def load_history_index(index_json: Path, history_csv: Path) -> Optional[Dict[str, Any]]:
+    """Charge l'index s'il correspond au CSV actuel, sinon None.
+
+    Le CSV étant en ajout seul, on compare sa taille (et non sa date de
+    modification, réinitialisée par chaque checkout git).
+    Un fichier illisible (tronqué par un run interrompu...) est traité comme
+    périmé : l'index n'est qu'un cache, on le reconstruira.
+    """
+    try:
+        index = load_json(index_json, default=None)
+    except (OSError, ValueError):  # JSONDecodeError (json / orjson) hérite de ValueError
+        return None
+    if not isinstance(index, dict) or not history_csv.exists():
+        return None
+    if index.get("csv_size") != history_csv.stat().st_size:
+        return None
+    if not isinstance(index.get("canonical_names"), dict) or not isinstance(index.get("keys_at_last_ts"), list):
+        return None
+    if not isinstance(index.get("last_timestamp"), (str, type(None))):
+        return None
+    return index
+
+
+def existing_keys_from_index(
+    index: Dict[str, Any],
+    history_csv: Path,
+    date_str: str,
+    time_str: str,
+) -> set[Tuple[str, str]]:
+    """Comme `existing_keys_for_timestamp`, sans relire le CSV quand l'index suffit."""
+    ts = f"{date_str} {time_str}"
+    last = index.get("last_timestamp")
+    if last is None or ts > last:
+        return set()
+    if ts == last:
+        return {(typ, name) for typ, name in index.get("keys_at_last_ts", [])}
+    return existing_keys_for_timestamp(history_csv, date_str, time_str)
+
+
+def update_history_index(index: Dict[str, Any], rows: List[CsvRow], history_csv: Path) -> None:
+    """Met à jour l'index après un `append_semicolon_csv(history_csv, rows, ...)`."""
+    canonical = index.setdefault("canonical_names", {})
+    keys = {(typ, name) for typ, name in index.get("keys_at_last_ts", [])}
+    last = index.get("last_timestamp")
+
+    for r in rows:
+        canonical.setdefault(r.type, {}).setdefault(normalize_key(r.name), r.name)
+        ts = f"{r.date} {r.time}"
+        if last is None or ts > last:
+            last = ts
+            keys = set()
+        if ts == last:
+            keys.add((r.type, r.name))
+
+    index["last_timestamp"] = last
+    index["keys_at_last_ts"] = sorted([typ, name] for typ, name in keys)
+    index["csv_size"] = history_csv.stat().st_size